@@ -1,13 +1,36 @@
 import os
+import atexit
 import re
+import sys
+import heapq
+import functools
 import time
 import json
+import queue
+import itertools
+import threading
 import traceback
-import urllib.request
-import urllib.error
-from datetime import datetime, timedelta
+import unicodedata
+import http.client
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Callable, Dict, List, Any, NamedTuple, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+try:
+    import hyperscan  # optional: pip install hyperscan
+except ImportError:
+    hyperscan = None
+
+try:
+    import ahocorasick  # optional: pip install pyahocorasick
+except ImportError:
+    ahocorasick = None
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
@@ -19,11 +42,21 @@ EMBY_API_KEY = "api_key"
 
 WATCH_SECONDS = 5          # How long to tail each newly discovered file
 RETENTION_DAYS = 7          # Service logs retention under ./logs/
+TAIL_MAX_BYTES = 64 * 1024  # Only scan this much of a new file's existing content (0 = all)
 FILE_EXTS = (".log", ".txt")
-
-# Regex to parse item info from lines (works with plain or escaped JSON lines)
-ITEMID_RE = re.compile(r'"ItemId"\s*:\s*"?(?P<id>\d+)"?')
-NAME_RE   = re.compile(r'"Name"\s*:\s*"(?P<name>[^"]+)"')
+READ_CHUNK_BYTES = 1 << 16  # Bytes per os.read when draining a watched file
+LOG_CLEANUP_SECONDS = 3600  # How often to check whether today's log pruning has run
+RULE_RELOAD_SECONDS = 60    # How often rules.json is re-read
+REFRESH_WORKERS = 8         # Concurrent Emby API calls
+TAIL_WORKERS = os.cpu_count() or 4  # Files read and scanned concurrently
+
+# Regex to parse item info from lines (works with plain or escaped JSON lines).
+# Log data is scanned as raw bytes, so these and the rule patterns are bytes patterns.
+ITEMID_RE = re.compile(rb'"ItemId"\s*:\s*"?(?P<id>\d+)"?')
+NAME_RE   = re.compile(rb'"Name"\s*:\s*"(?P<name>[^"]+)"')
+# Literal keys located with bytes.find before falling back to the regexes above
+ITEMID_KEY = b'"ItemId"'
+NAME_KEY   = b'"Name"'
 # ====================================================
 
 #Exclude some files from being scanned when created
@@ -40,10 +73,51 @@ RULES_PATH = SCRIPT_DIR / "rules.json"    # hot-reloaded config
 SERVICE_LOG_DIR.mkdir(parents=True, exist_ok=True)
 
 Rule = Dict[str, Any]
-CompiledRule = Dict[str, Any]
-
-# Rate-limit cache keyed by (item_id, rule_name)
-recent_refresh: Dict[Tuple[str, str], float] = {}
+Matcher = Dict[str, Any]
+TailState = Dict[str, Any]
+
+class CompiledRule(NamedTuple):
+    name: str
+    rule_id: int  # stable across reloads, see rule_ids
+    pattern: re.Pattern
+    search: Callable[..., Optional[re.Match]]  # pattern.search, pre-bound for the per-line loop
+    action: str
+    rate_limit_seconds: int
+    level: str
+    literal: Optional[bytes]
+    pure: bool
+
+# Small int per rule name, assigned on first load and kept across reloads so cache keys stay valid
+rule_ids: Dict[str, int] = {}
+RULE_ID_BITS = 16
+
+# Rate-limit cache keyed by cache_key(item_id, rule): item id and rule id packed into one int
+recent_refresh: Dict[int, float] = {}
+# Min-heap of (expiry_ts, fired_ts, key); entries left behind by a re-fire are dropped lazily
+expiry_heap: List[Tuple[float, float, int]] = []
+
+# Files currently being tailed, keyed by path; read on tail_pool workers, expired from main.
+# Each state has its own "lock" serialising reads of that file. open_files_lock guards the dict
+# itself plus recent_refresh and expiry_heap. It may be taken with or without a state lock held,
+# but never acquire a state lock while holding open_files_lock.
+open_files: Dict[str, TailState] = {}
+open_files_lock = threading.Lock()
+
+# write_log only enqueues; log_writer owns the service log file and writes it in batches
+log_q: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+log_ts: Tuple[int, str] = (-1, "")  # last formatted timestamp, see log_timestamp
+log_cleanup_day: Optional[str] = None  # day cleanup_service_logs last ran
+
+# Set to make the main loop re-check its deadlines (e.g. a new watch started)
+housekeeping_wakeup = threading.Event()
+
+# Emby API calls run here so a slow server never stalls log reading; each worker keeps its own
+# keep-alive connection in emby_conn
+refresh_pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="emby-refresh")
+emby_conn = threading.local()
+
+# Watchdog events are handed off here so the observer thread never waits on a read or scan
+tail_pool = ThreadPoolExecutor(max_workers=TAIL_WORKERS, thread_name_prefix="tail")
 
 
 def is_excluded(filename):
@@ -53,43 +127,368 @@ def base(file_path: str) -> str:
     #Return only the filename portion of a path.
     return os.path.basename(file_path)
 
-def service_log_path_for_today() -> Path:
-    return SERVICE_LOG_DIR / f"emby-ebml-tail-{datetime.now().strftime('%Y%m%d')}.log"
+def service_log_path(day: str) -> Path:
+    return SERVICE_LOG_DIR / f"emby-ebml-tail-{day}.log"
+
+def log_timestamp() -> str:
+    # Formatted once per second; (second, text) is swapped as one tuple so threads never see a mix
+    global log_ts
+    sec = int(time.time())
+    if sec != log_ts[0]:
+        log_ts = (sec, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(sec)))
+    return log_ts[1]
+
+class LazyTrace:
+    # Stands in for traceback.format_exc() in log details: grabs the exception cheaply now and
+    # only walks and formats the stack when the log writer repr()s it
+    def __init__(self):
+        self.exc_info = sys.exc_info()
+        self.text: Optional[str] = None
+    def __repr__(self):
+        if self.text is None:
+            self.text = "".join(traceback.format_exception(*self.exc_info))
+            self.exc_info = None
+        return repr(self.text)
 
 def write_log(event: str, details: Optional[dict] = None):
-    now = datetime.now().isoformat(timespec='seconds')
+    # Non-blocking: timestamp now, format and write later on the log writer thread
+    log_q.put((log_timestamp(), event, details))
+
+def format_log_line(now: str, event: str, details: Optional[dict]) -> Tuple[str, str]:
     level = (details or {}).pop("_level", "INFO")
     kv = ""
     if details:
         kv = " | " + " ".join(f"{k}={repr(v)}" for k, v in details.items())
-    line = f"{now} | {level} | {event}{kv}\n"
-    try:
-        with service_log_path_for_today().open("a", encoding="utf-8") as f:
-            f.write(line)
-    except Exception:
-        print("[LOG-ERR]", line)
+    return level, f"{now} | {level} | {event}{kv}\n"
+
+def log_writer():
+    # Drains log_q in batches: one writelines + flush per batch, fsync only when it holds an ERROR.
+    # The day's file stays open and is reopened when the date rolls over.
+    # Queue items are (timestamp, event, details), or None to stop.
+    fh = None
+    day = None
+    while True:
+        batch = [log_q.get()]
+        while True:
+            try:
+                batch.append(log_q.get_nowait())
+            except queue.Empty:
+                break
+
+        entries: List[Tuple[str, str]] = []
+        errors = stop = False
+        for item in batch:
+            if item is None:
+                stop = True
+            else:
+                now, event, details = item
+                try:
+                    level, line = format_log_line(now, event, details)
+                except Exception as e:
+                    print("[LOG-ERR]", event, "format failed:", e)
+                    continue
+                errors = errors or level == "ERROR"
+                entries.append((now[:10].replace("-", ""), line))
+
+        try:
+            for today, group in itertools.groupby(entries, key=lambda e: e[0]):
+                if today != day or fh is None:
+                    if fh is not None:
+                        fh.close()
+                    fh = None
+                    fh = service_log_path(today).open("a", encoding="utf-8")
+                    day = today
+                fh.writelines(line for _, line in group)
+            if fh is not None:
+                fh.flush()
+                if errors:
+                    os.fsync(fh.fileno())
+        except Exception:
+            for _, line in entries:
+                print("[LOG-ERR]", line)
+
+        if stop:
+            if fh is not None:
+                fh.close()
+            return
+
+log_writer_thread = threading.Thread(target=log_writer, name="log-writer", daemon=True)
+log_writer_thread.start()
+
+def stop_log_writer(timeout: float = 5):
+    # Write out everything queued so far, then stop the writer
+    if not log_writer_thread.is_alive():
+        return
+    log_q.put(None)
+    log_writer_thread.join(timeout)
+
+# The writer is a daemon thread, so also drain the queue if the process exits without reaching
+# the end of main
+atexit.register(stop_log_writer)
+
+SPACE_BYTES = b" \t\n\r\x0b\x0c"  # what \s matches in a bytes pattern
+
+def value_start(line: bytes, pos: int) -> int:
+    # Index just past `\s*:\s*` at pos, or -1
+    n = len(line)
+    while pos < n and line[pos] in SPACE_BYTES:
+        pos += 1
+    if pos >= n or line[pos] != ord(":"):
+        return -1
+    pos += 1
+    while pos < n and line[pos] in SPACE_BYTES:
+        pos += 1
+    return pos
+
+def extract_item_id(line: bytes) -> Optional[bytes]:
+    # Same result as ITEMID_RE.search, without running the regex on lines lacking the key
+    k = line.find(ITEMID_KEY)
+    if k < 0:
+        return None
+    i = value_start(line, k + len(ITEMID_KEY))
+    if i >= 0:
+        if line.startswith(b'"', i):
+            i += 1
+        j = i
+        while j < len(line) and 48 <= line[j] <= 57:  # ASCII digit
+            j += 1
+        if j > i:
+            return line[i:j]
+    m = ITEMID_RE.search(line, k + 1)
+    return m.group("id") if m else None
+
+def extract_name(line: bytes) -> Optional[bytes]:
+    # Same result as NAME_RE.search, without running the regex on lines lacking the key
+    k = line.find(NAME_KEY)
+    if k < 0:
+        return None
+    i = value_start(line, k + len(NAME_KEY))
+    if i >= 0 and line.startswith(b'"', i):
+        j = line.find(b'"', i + 1)
+        if j > i + 1:
+            return line[i + 1:j]
+    m = NAME_RE.search(line, k + 1)
+    return m.group("name") if m else None
 
 def cleanup_service_logs():
-    cutoff = datetime.now() - timedelta(days=RETENTION_DAYS)
-    for p in SERVICE_LOG_DIR.glob("emby-ebml-tail-*.log"):
+    # Retention is counted in days, so one pass per day is enough
+    global log_cleanup_day
+    today = time.strftime("%Y%m%d")
+    if today == log_cleanup_day:
+        return
+    cutoff = time.time() - RETENTION_DAYS * 86400
+    try:
+        with os.scandir(SERVICE_LOG_DIR) as it:
+            for entry in it:
+                if not (entry.name.startswith("emby-ebml-tail-") and entry.name.endswith(".log")):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        try:
+                            os.unlink(entry.path)
+                        except FileNotFoundError:
+                            pass
+                        write_log("LogRetentionDelete", {"path": entry.path})
+                except Exception as e:
+                    write_log("LogRetentionError", {"path": entry.path, "error": str(e), "_level": "ERROR"})
+    except OSError as e:
+        # Directory missing or unreadable: leave log_cleanup_day unset so the next pass retries
+        write_log("LogRetentionError", {"path": str(SERVICE_LOG_DIR), "error": str(e), "_level": "ERROR"})
+        return
+    log_cleanup_day = today
+
+def parse_literal(pattern: re.Pattern) -> Tuple[Optional[bytes], bool]:
+    # Longest literal run every match of the pattern must contain (None if there is no safe one),
+    # and whether the pattern is nothing but that literal
+    if pattern.flags & re.IGNORECASE:
+        return None, False
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None, False
+    best, run = b"", b""
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run += bytes((av,))
+            continue
+        best, run = max(best, run, key=len), b""
+    if run and len(run) == len(parsed):
+        return run, True
+    best = max(best, run, key=len)
+    return (best if len(best) >= 4 else None), False
+
+def build_hyperscan_db(compiled: List[CompiledRule]):
+    # Prefilter mode lets Hyperscan accept constructs it cannot match exactly (e.g. backrefs);
+    # it may over-report, so hits are confirmed with the rule's own regex.
+    flags = []
+    for r in compiled:
+        f = hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_PREFILTER
+        if r.pattern.flags & re.IGNORECASE:
+            f |= hyperscan.HS_FLAG_CASELESS
+        if r.pattern.flags & re.DOTALL:
+            f |= hyperscan.HS_FLAG_DOTALL
+        if r.pattern.flags & re.MULTILINE:
+            f |= hyperscan.HS_FLAG_MULTILINE
+        flags.append(f)
+    db = hyperscan.Database()
+    db.compile(
+        expressions=[r.pattern.pattern for r in compiled],
+        ids=list(range(len(compiled))),
+        elements=len(compiled),
+        flags=flags,
+    )
+    return db
+
+def collect_hit(rule_idx, start, end, flags, hits):
+    hits.append(rule_idx)
+
+def scoped_source(pattern: re.Pattern) -> bytes:
+    # Pattern source with its compile-time IGNORECASE applied inline, so it survives being
+    # embedded in the combined alternation
+    if pattern.flags & re.IGNORECASE:
+        return b"(?i:%s)" % pattern.pattern
+    return pattern.pattern
+
+def build_scanner(compiled: List[CompiledRule]) -> Callable[..., List[CompiledRule]]:
+    # Generate scan(line, hit) with one unrolled check per rule, in rule order. Only generated
+    # names appear in the source; the rules themselves are passed in through the namespace.
+    ns: Dict[str, Any] = {}
+    src = ["def scan(line, hit):", "    out = []"]
+    for i, r in enumerate(compiled):
+        ns[f"_r{i}"] = r
+        if r.pure:
+            ns[f"_l{i}"] = r.literal
+            test = f"_l{i} in line"
+        else:
+            ns[f"_s{i}"] = r.search
+            test = f"_s{i}(line)"
+        src.append(f"    if hit is _r{i} or {test}:")
+        src.append(f"        out.append(_r{i})")
+    src.append("    return out")
+    exec("\n".join(src), ns)
+    return ns["scan"]
+
+def build_matcher(compiled: List[CompiledRule]) -> Matcher:
+    # Prefer a Hyperscan database over all rules, then an Aho-Corasick automaton over the rule
+    # literals, when the optional packages are installed; otherwise one alternation over all
+    # rules, gated by a cheap substring check per line.
+    # Rules that cannot be wrapped safely (numbered backrefs, global inline flags) disable the gate.
+    # "literals" holds every rule's required substring when all rules have one, so callers can
+    # rule out whole blocks of text; it is () when there are no rules at all.
+    matcher: Matcher = {
+        "database": None, "scratch": None,
+        "automaton": None, "always": (),
+        "combined": None, "groups": {}, "literals": None,
+        "scan": build_scanner(compiled),
+    }
+    if all(r.literal for r in compiled):
+        matcher["literals"] = tuple({r.literal for r in compiled})
+    if not compiled:
+        return matcher
+    if hyperscan is not None:
         try:
-            mtime = datetime.fromtimestamp(p.stat().st_mtime)
-            if mtime < cutoff:
-                p.unlink(missing_ok=True)
-                write_log("LogRetentionDelete", {"path": str(p)})
+            db = build_hyperscan_db(compiled)
+            hyperscan.Scratch(db)  # fail here rather than on first scan
+            # Scratch space cannot be shared between concurrent scans; one per tail worker
+            matcher["scratch"] = threading.local()
+            matcher["database"] = db
+            return matcher
         except Exception as e:
-            write_log("LogRetentionError", {"path": str(p), "error": str(e), "_level": "ERROR"})
+            write_log("HyperscanCompileError", {"error": str(e), "_level": "WARN"})
+    if ahocorasick is not None:
+        # pyahocorasick is built for str keys; latin-1 maps each byte to one char and back
+        by_literal: Dict[str, List[int]] = {}
+        for i, r in enumerate(compiled):
+            if r.literal:
+                by_literal.setdefault(r.literal.decode("latin-1"), []).append(i)
+        automaton = ahocorasick.Automaton()
+        for lit, idxs in by_literal.items():
+            automaton.add_word(lit, tuple(idxs))
+        if by_literal:
+            automaton.make_automaton()
+            matcher["automaton"] = automaton
+            matcher["always"] = tuple(i for i, r in enumerate(compiled) if not r.literal)
+            return matcher
+    if any(re.search(rb"\\[1-9]|\(\?\(", r.pattern.pattern) for r in compiled):
+        return matcher
+    try:
+        matcher["combined"] = re.compile(b"|".join(
+            b"(?P<r%d>%s)" % (i, scoped_source(r.pattern)) for i, r in enumerate(compiled)
+        ))
+    except re.error:
+        return matcher
+    matcher["groups"] = {f"r{i}": r for i, r in enumerate(compiled)}
+    return matcher
+
+def match_rules(line: bytes, compiled_rules: List[CompiledRule], matcher: Matcher) -> List[CompiledRule]:
+    # Rules matching the line, in configured order
+    db = matcher["database"]
+    if db is not None:
+        hits: List[int] = []
+        local = matcher["scratch"]
+        scratch = getattr(local, "scratch", None)
+        if scratch is None:
+            scratch = local.scratch = hyperscan.Scratch(db)
+        db.scan(line, match_event_handler=collect_hit, context=hits, scratch=scratch)
+        return [
+            compiled_rules[i] for i in sorted(hits)
+            if compiled_rules[i].pure or compiled_rules[i].search(line)
+        ]
+
+    automaton = matcher["automaton"]
+    if automaton is not None:
+        # One pass over the line finds every rule whose literal occurs in it
+        hits = {i for _, idxs in automaton.iter(line.decode("latin-1")) for i in idxs}
+        hits.update(matcher["always"])
+        return [
+            compiled_rules[i] for i in sorted(hits)
+            if compiled_rules[i].pure or compiled_rules[i].search(line)
+        ]
+
+    hit = None
+    combined = matcher["combined"]
+    if combined is not None:
+        # Cheap substring gate first, then a single regex pass over all rules
+        literals = matcher["literals"]
+        if literals is not None and not any(lit in line for lit in literals):
+            return []
+        m_rule = combined.search(line)
+        if not m_rule:
+            return []
+        hit = matcher["groups"][m_rule.lastgroup]
+    return matcher["scan"](line, hit)
+
+UNICODE_ESCAPE_RE = re.compile(r"\\(?:N\{([^}]*)\}|u([0-9a-fA-F]{4})|U([0-9a-fA-F]{8})|(.))", re.DOTALL)
+
+def compile_bytes_pattern(source: str, flags: int) -> re.Pattern:
+    # Rule patterns are written as str regexes but matched against raw bytes. \N{...}, \uXXXX
+    # and \UXXXXXXXX escapes have no bytes form, so they are replaced by the escaped UTF-8 of
+    # the character they name; every other escape is kept as is.
+    re.compile(source, flags)  # surface ordinary syntax errors with the usual message
+    def translate(m: "re.Match[str]") -> str:
+        if m.group(4) is not None:
+            return m.group(0)
+        if m.group(1) is not None:
+            char = unicodedata.lookup(m.group(1))
+        else:
+            char = chr(int(m.group(2) or m.group(3), 16))
+        return re.escape(char)
+    try:
+        return re.compile(UNICODE_ESCAPE_RE.sub(translate, source).encode("utf-8"), flags)
+    except re.error as e:
+        # e.g. an inline (?u) flag, which only exists for str patterns
+        raise ValueError(f"pattern is not supported when matching raw bytes: {e}") from None
 
-def load_rules() -> Tuple[List[CompiledRule], Dict[str, Any]]:
+def load_rules() -> Tuple[List[CompiledRule], Matcher, Dict[str, Any]]:
     try:
         with RULES_PATH.open("r", encoding="utf-8") as f:
             cfg = json.load(f)
     except FileNotFoundError:
         write_log("RulesNotFound", {"path": str(RULES_PATH), "_level": "ERROR"})
-        return [], {"stop_on_first_action": True, "rule_reload_seconds": 60}
+        return [], build_matcher([]), {"stop_on_first_action": True, "rule_reload_seconds": 60}
     except Exception as e:
-        write_log("RulesLoadError", {"error": str(e), "trace": traceback.format_exc(), "_level": "ERROR"})
-        return [], {"stop_on_first_action": True, "rule_reload_seconds": 60}
+        write_log("RulesLoadError", {"error": str(e), "trace": LazyTrace(), "_level": "ERROR"})
+        return [], build_matcher([]), {"stop_on_first_action": True, "rule_reload_seconds": 60}
 
     rules = cfg.get("rules", [])
     global_cfg = cfg.get("global", {"stop_on_first_action": True, "rule_reload_seconds": 60})
@@ -97,131 +496,323 @@ def load_rules() -> Tuple[List[CompiledRule], Dict[str, Any]]:
     compiled: List[CompiledRule] = []
     for r in rules:
         try:
-            compiled.append({
-                "name": r["name"],
-                "pattern": re.compile(r["pattern"]),
-                "action": r.get("action", "refresh_metadata"),
-                "rate_limit_seconds": int(r.get("rate_limit_seconds", 300)),
-                "level": r.get("level", "WARN"),
-            })
+            flags = re.IGNORECASE if r.get("ignore_case", False) else 0
+            pattern = compile_bytes_pattern(r["pattern"], flags)
+            literal, pure = parse_literal(pattern)
+            name = sys.intern(r["name"])
+            rule_id = rule_ids.setdefault(name, len(rule_ids))
+            if rule_id >> RULE_ID_BITS:
+                raise ValueError("too many distinct rule names")
+            compiled.append(CompiledRule(
+                name=name,
+                rule_id=rule_id,
+                pattern=pattern,
+                search=pattern.search,
+                action=r.get("action", "refresh_metadata"),
+                rate_limit_seconds=int(r.get("rate_limit_seconds", 300)),
+                level=r.get("level", "WARN"),
+                literal=literal,
+                pure=pure,
+            ))
         except Exception as e:
             write_log("RuleCompileError", {"rule": r, "error": str(e), "_level": "ERROR"})
-    write_log("RulesLoaded", {"count": len(compiled)})
-    return compiled, global_cfg
+    matcher = build_matcher(compiled)
+    write_log("RulesLoaded", {
+        "count": len(compiled),
+        "hyperscan": matcher["database"] is not None,
+        "automaton": matcher["automaton"] is not None,
+        "combined": matcher["combined"] is not None,
+    })
+    return compiled, matcher, global_cfg
+
+def emby_connection() -> http.client.HTTPConnection:
+    conn = getattr(emby_conn, "conn", None)
+    if conn is None:
+        url = urllib.parse.urlsplit(EMBY_SERVER)
+        cls = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        conn = emby_conn.conn = cls(url.netloc, timeout=15)
+    return conn
 
 def call_emby_refresh(item_id: str) -> int:
-    url = (
-        f"{EMBY_SERVER}/Items/{item_id}/Refresh"
+    path = (
+        f"{urllib.parse.urlsplit(EMBY_SERVER).path.rstrip('/')}/Items/{item_id}/Refresh"
         f"?api_key={EMBY_API_KEY}&MetadataRefreshMode=FullRefresh&ReplaceAllMetadata=true&ReplaceAllImages=false"
     )
-    req = urllib.request.Request(url, method="POST")
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return resp.getcode()
-    except urllib.error.HTTPError as e:
-        return e.code
-    except Exception as e:
-        write_log("ApiTransportError", {"item_id": item_id, "error": str(e), "_level": "ERROR"})
-        return 0
-
-def perform_action(action: str, item_id: str, name: Optional[str]) -> int:
+    for attempt in (1, 2):
+        conn = None
+        try:
+            conn = emby_connection()
+            conn.request("POST", path)
+            resp = conn.getresponse()
+            resp.read()  # drain so the connection can be reused
+            return resp.status
+        except Exception as e:
+            if conn is not None:
+                conn.close()
+            emby_conn.conn = None
+            # A kept-alive connection the server already dropped gets one retry on a fresh one
+            stale = isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError))
+            if attempt == 1 and stale:
+                continue
+            write_log("ApiTransportError", {"item_id": item_id, "error": str(e), "_level": "ERROR"})
+            return 0
+
+def perform_action(action: str, item_id: str, name: Optional[str]) -> "Future[int]":
+    # Resolves to the HTTP status code, or 0 when the action could not be performed
     if action == "refresh_metadata":
-        return call_emby_refresh(item_id)
+        return refresh_pool.submit(call_emby_refresh, item_id)
     write_log("UnknownAction", {"action": action, "_level": "ERROR"})
-    return 0
-
-def cleanup_cache(now: float, rules: List[CompiledRule]):
-    expired = []
-    for key, ts in recent_refresh.items():
-        item_id, rule_name = key
-        ttl = next((r["rate_limit_seconds"] for r in rules if r["name"] == rule_name), 300)
-        if (now - ts) >= ttl:
-            expired.append(key)
-    for key in expired:
-        recent_refresh.pop(key, None)
+    done: "Future[int]" = Future()
+    done.set_result(0)
+    return done
 
-def can_fire(item_id: str, rule: CompiledRule, now: float) -> bool:
-    last_ts = recent_refresh.get((item_id, rule["name"]))
-    return last_ts is None or (now - last_ts) >= rule["rate_limit_seconds"]
+def log_action_called(details: dict, future: "Future[int]"):
+    write_log("ActionCalled", dict(details, status_code=future.result()))
 
-def mark_fired(item_id: str, rule: CompiledRule, now: float):
-    recent_refresh[(item_id, rule["name"])] = now
+def cleanup_cache(now: float):
+    while expiry_heap and expiry_heap[0][0] <= now:
+        _, fired_ts, key = heapq.heappop(expiry_heap)
+        if recent_refresh.get(key) == fired_ts:
+            del recent_refresh[key]
 
-def tail_file(filepath: str, timeout: int, compiled_rules: List[CompiledRule], global_cfg: Dict[str, Any]):
-    write_log("WatchStart", {"file": base(filepath), "timeout_s": timeout})
-    start = time.time()
-    item_id: Optional[str] = None
-    name: Optional[str] = None
-    stop_on_first_action = bool(global_cfg.get("stop_on_first_action", True))
+def next_cache_expiry() -> Optional[float]:
+    with open_files_lock:
+        return expiry_heap[0][0] if expiry_heap else None
 
-    try:
-        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-            f.seek(0, os.SEEK_SET)
-            while True:
-                now = time.time()
-                cleanup_cache(now, compiled_rules)
-                cleanup_service_logs()
+def cache_key(item_id: str, rule: CompiledRule) -> int:
+    return (int(item_id) << RULE_ID_BITS) | rule.rule_id
 
-                if (now - start) >= timeout:
-                    write_log("WatchTimeout", {"file": filepath})
-                    return
+def can_fire(item_id: str, rule: CompiledRule, now: float) -> bool:
+    last_ts = recent_refresh.get(cache_key(item_id, rule))
+    return last_ts is None or (now - last_ts) >= rule.rate_limit_seconds
+
+def mark_fired(item_id: str, rule: CompiledRule, now: float):
+    key = cache_key(item_id, rule)
+    recent_refresh[key] = now
+    heapq.heappush(expiry_heap, (now + rule.rate_limit_seconds, now, key))
+
+def last_value(text: bytes, key: bytes, extract: Callable[[bytes], Optional[bytes]]) -> Optional[bytes]:
+    # Value from the last line of text that yields one, i.e. what line-by-line extraction ends on
+    end = len(text)
+    while True:
+        k = text.rfind(key, 0, end)
+        if k < 0:
+            return None
+        start = text.rfind(b"\n", 0, k) + 1
+        stop = text.find(b"\n", k)
+        value = extract(text[start:stop if stop >= 0 else len(text)])
+        if value:
+            return value
+        end = start
+
+def scan_block(block: bytes, state: TailState, now: float) -> bool:
+    # Returns True once the file no longer needs watching (stop_on_first_action).
+    # Most blocks contain no rule literal at all; then no line can match, and only the last
+    # ItemId/Name in the block matter, so skip the per-line loop entirely.
+    if b"\r" in block:
+        # Text-mode reads used to turn CRLF into LF; keep `$` and snippets behaving the same.
+        # The block ends just before a line break, so a trailing \r is the last line's CR.
+        block = block.replace(b"\r\n", b"\n")
+        if block.endswith(b"\r"):
+            block = block[:-1]
+    literals = state["matcher"]["literals"]
+    if literals is not None and not any(lit in block for lit in literals):
+        state["item_id"] = last_value(block, ITEMID_KEY, extract_item_id) or state["item_id"]
+        state["name"] = last_value(block, NAME_KEY, extract_name) or state["name"]
+        return False
+    return process_lines(block.split(b"\n"), state, now)
+
+def process_lines(lines: List[bytes], state: TailState, now: float) -> bool:
+    # Returns True once the file no longer needs watching (stop_on_first_action)
+    filepath = state["path"]
+    compiled_rules = state["rules"]
+    matcher = state["matcher"]
+    stop = state["stop_on_first_action"]
+    item_id = state["item_id"]
+    name = state["name"]
+    # Bind hot callables locally so the per-line loop avoids global lookups
+    find_item_id = extract_item_id
+    find_name = extract_name
+    match = match_rules
+    log = write_log
 
-                line = f.readline()
-                if not line:
-                    time.sleep(0.25)
+    try:
+        for line in lines:
+            item_id = find_item_id(line) or item_id
+            name = find_name(line) or name
+
+            matched = match(line, compiled_rules, matcher)
+            if not matched:
+                continue
+
+            # Only matched lines are decoded, for logging and the API call
+            item = item_id.decode("ascii") if item_id else None
+            item_name = name.decode("utf-8", "ignore") if name else None
+            snippet = line.decode("utf-8", "ignore").strip()[:200]
+            for rule in matched:
+                lvl = rule.level
+                log("RuleMatched", {
+                    "file": filepath, "rule": rule.name, "level": lvl,
+                    "item_id": item, "name": item_name,
+                    "line_snippet": snippet
+                })
+                if not item:
+                    log("ActionSkippedNoItemId", {
+                        "rule": rule.name, "file": filepath, "_level": "WARN"
+                    })
                     continue
 
-                m_id = ITEMID_RE.search(line)
-                if m_id:
-                    item_id = m_id.group("id")
-
-                m_name = NAME_RE.search(line)
-                if m_name:
-                    name = m_name.group("name")
-
-                for rule in compiled_rules:
-                    if rule["pattern"].search(line):
-                        lvl = rule["level"]
-                        write_log("RuleMatched", {
-                            "file": filepath, "rule": rule["name"], "level": lvl,
-                            "item_id": item_id, "name": name,
-                            "line_snippet": line.strip()[:200]
-                        })
-                        if not item_id:
-                            write_log("ActionSkippedNoItemId", {
-                                "rule": rule["name"], "file": filepath, "_level": "WARN"
-                            })
-                            continue
-
-                        if can_fire(item_id, rule, now):
-                            status = perform_action(rule["action"], item_id, name)
-                            mark_fired(item_id, rule, now)
-                            write_log("ActionCalled", {
-                                "rule": rule["name"], "action": rule["action"],
-                                "file": base(filepath), "item_id": item_id, "name": name,
-                                "status_code": status
-                            })
-                        else:
-                            ttl = rule["rate_limit_seconds"]
-                            wait_left = int(ttl - (now - recent_refresh[(item_id, rule["name"])]))
-                            write_log("ActionSkippedTTL", {
-                                "rule": rule["name"], "file": filepath,
-                                "item_id": item_id, "name": name, "wait_left_s": wait_left
-                            })
-
-                        if stop_on_first_action:
-                            return
+                with open_files_lock:
+                    fire = can_fire(item, rule, now)
+                    if fire:
+                        mark_fired(item, rule, now)
+                    else:
+                        last_ts = recent_refresh[cache_key(item, rule)]
+                if fire:
+                    future = perform_action(rule.action, item, item_name)
+                    future.add_done_callback(functools.partial(log_action_called, {
+                        "rule": rule.name, "action": rule.action,
+                        "file": base(filepath), "item_id": item, "name": item_name,
+                    }))
+                else:
+                    ttl = rule.rate_limit_seconds
+                    wait_left = int(ttl - (now - last_ts))
+                    log("ActionSkippedTTL", {
+                        "rule": rule.name, "file": filepath,
+                        "item_id": item, "name": item_name, "wait_left_s": wait_left
+                    })
+
+                if stop:
+                    return True
+        return False
+    finally:
+        state["item_id"] = item_id
+        state["name"] = name
+
+def close_tail(state: TailState):
+    # Caller must hold state["lock"]
+    with open_files_lock:
+        if open_files.get(state["path"]) is state:
+            del open_files[state["path"]]
+    if state["fd"] is not None:
+        os.close(state["fd"])
+        state["fd"] = None
+
+def drain_tail(state: TailState, now: float, final: bool) -> bool:
+    # Read everything appended since the last read and feed complete lines to scan_block.
+    # When final, an unterminated last line is scanned too instead of being kept as leftover.
+    # Returns True once the file no longer needs watching (stop_on_first_action).
+    chunks = [state["leftover"]]
+    while True:
+        chunk = os.read(state["fd"], READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    data = b"".join(chunks)
+    if state["skip_partial"]:
+        # start_tail seeked into the middle of the file; drop up to the first line break
+        nl = data.find(b"\n")
+        state["skip_partial"] = nl < 0
+        data = data[nl + 1:] if nl >= 0 else b""
+    if final:
+        state["leftover"] = b""
+        block = data.rstrip(b"\r\n")
+        return bool(block) and scan_block(block, state, now)
+    cut = data.rfind(b"\n")
+    state["leftover"] = data[cut + 1:]
+    return cut >= 0 and scan_block(data[:cut], state, now)
+
+def advance_tail(state: TailState):
+    # Caller must hold state["lock"]. Once the deadline has passed, drains the file one last
+    # time, including a final line with no newline, then closes it.
+    if state["fd"] is None:
+        return
+    now = time.time()
+    timed_out = now >= state["deadline"]
+    try:
+        if drain_tail(state, now, timed_out):
+            close_tail(state)
+        elif timed_out:
+            write_log("WatchTimeout", {"file": state["path"]})
+            close_tail(state)
+    except Exception as e:
+        write_log("WatchUnhandledError", {
+            "file": base(state["path"]), "error": str(e), "trace": LazyTrace(), "_level": "ERROR"
+        })
+        close_tail(state)
+
+def read_tail(filepath: str):
+    state = open_files.get(filepath)
+    if state is None:
+        return
+    # Cleared before reading, so a modify event arriving from here on queues another read
+    state["read_pending"] = False
+    with state["lock"]:
+        advance_tail(state)
+
+def start_tail(filepath: str, timeout: int, compiled_rules: List[CompiledRule], matcher: Matcher,
+               global_cfg: Dict[str, Any]):
+    write_log("WatchStart", {"file": base(filepath), "timeout_s": timeout})
+    fd = None
+    skip_partial = False
+    try:
+        fd = os.open(filepath, os.O_RDONLY)
+        size = os.fstat(fd).st_size
+        if TAIL_MAX_BYTES and size > TAIL_MAX_BYTES:
+            # Start one byte early so a window that begins exactly on a line keeps that line
+            skipped = size - TAIL_MAX_BYTES - 1
+            os.lseek(fd, skipped, os.SEEK_SET)
+            skip_partial = True
+            write_log("WatchSkipAhead", {"file": base(filepath), "skipped_bytes": skipped})
     except FileNotFoundError:
         write_log("WatchFileNotFound", {"file": base(filepath), "_level": "ERROR"})
+        return
     except Exception as e:
         write_log("WatchUnhandledError", {
-            "file": base(filepath), "error": str(e), "trace": traceback.format_exc(), "_level": "ERROR"
+            "file": base(filepath), "error": str(e), "trace": LazyTrace(), "_level": "ERROR"
         })
+        if fd is not None:
+            os.close(fd)
+        return
+    state: TailState = {
+        "path": filepath,
+        "lock": threading.Lock(),
+        "fd": fd,
+        "leftover": b"",
+        "skip_partial": skip_partial,
+        "read_pending": False,  # a read_tail is already queued on tail_pool, see on_modified
+        "deadline": time.time() + timeout,
+        "item_id": None,
+        "name": None,
+        "rules": compiled_rules,
+        "matcher": matcher,
+        "stop_on_first_action": bool(global_cfg.get("stop_on_first_action", True)),
+    }
+    with open_files_lock:
+        previous = open_files.get(filepath)
+        open_files[filepath] = state
+    if previous is not None:
+        with previous["lock"]:
+            close_tail(previous)
+    housekeeping_wakeup.set()
+    read_tail(filepath)
+
+def next_tail_deadline() -> Optional[float]:
+    with open_files_lock:
+        return min((st["deadline"] for st in open_files.values()), default=None)
+
+def expire_tails(now: float):
+    with open_files_lock:
+        expired = [st for st in open_files.values() if now >= st["deadline"]]
+    for state in expired:
+        with state["lock"]:
+            advance_tail(state)
 
 class NewLogFileHandler(FileSystemEventHandler):
-    def __init__(self, compiled_rules, global_cfg):
+    def __init__(self, compiled_rules, matcher, global_cfg):
         super().__init__()
         self.compiled_rules = compiled_rules
+        self.matcher = matcher
         self.global_cfg = global_cfg
     def on_created(self, event):
         if event.is_directory:
@@ -232,27 +823,59 @@ class NewLogFileHandler(FileSystemEventHandler):
             return
         if event.src_path.lower().endswith(FILE_EXTS):
             write_log("NewFileDetected", {"file": base(event.src_path)})
-            tail_file(event.src_path, WATCH_SECONDS, self.compiled_rules, self.global_cfg)
+            tail_pool.submit(
+                start_tail, event.src_path, WATCH_SECONDS, self.compiled_rules, self.matcher, self.global_cfg
+            )
+    def on_modified(self, event):
+        # Emby writes to its main log constantly; only queue work for files being tailed, and
+        # at most one pending read per file since a single read drains everything written so far
+        if event.is_directory:
+            return
+        state = open_files.get(event.src_path)
+        if state is None or state["read_pending"]:
+            return
+        state["read_pending"] = True
+        tail_pool.submit(read_tail, event.src_path)
 
 def main():
-    compiled_rules, global_cfg = load_rules()
-    event_handler = NewLogFileHandler(compiled_rules, global_cfg)
+    compiled_rules, matcher, global_cfg = load_rules()
+    event_handler = NewLogFileHandler(compiled_rules, matcher, global_cfg)
     observer = Observer()
     observer.schedule(event_handler, LOG_FOLDER, recursive=False)
     observer.start()
     write_log("ServiceStart", {"log_folder": LOG_FOLDER})
 
+    now = time.time()
+    next_log_cleanup = now
+    next_reload = now + RULE_RELOAD_SECONDS
     try:
         while True:
-            cleanup_service_logs()
-            # Hot-reload rules every minute
-            time.sleep(60)
-            compiled_rules, global_cfg = load_rules()
-            event_handler.compiled_rules = compiled_rules
-            event_handler.global_cfg = global_cfg
+            # Housekeeping runs here, off the read path. Instead of ticking, sleep until the
+            # nearest deadline or until another thread sets housekeeping_wakeup.
+            housekeeping_wakeup.clear()
+            now = time.time()
+            expire_tails(now)
+            with open_files_lock:
+                cleanup_cache(now)
+            if now >= next_log_cleanup:
+                cleanup_service_logs()
+                next_log_cleanup = now + LOG_CLEANUP_SECONDS
+            if now >= next_reload:
+                # Hot-reload rules
+                compiled_rules, matcher, global_cfg = load_rules()
+                event_handler.compiled_rules = compiled_rules
+                event_handler.matcher = matcher
+                event_handler.global_cfg = global_cfg
+                next_reload = now + RULE_RELOAD_SECONDS
+
+            deadlines = [next_log_cleanup, next_reload, next_tail_deadline(), next_cache_expiry()]
+            housekeeping_wakeup.wait(max(0.0, min(d for d in deadlines if d is not None) - now))
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    tail_pool.shutdown(wait=True)
+    refresh_pool.shutdown(wait=True)
+    stop_log_writer()
 
 if __name__ == "__main__":
     main()